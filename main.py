@@ -1,7 +1,23 @@
-import os, re, html, json, threading, secrets, time, glob, queue, yt_dlp, requests, importlib.metadata
-from mutagen.id3 import ID3, ID3NoHeaderError, TPE1, TPE2, TALB, TIT2, TRCK, TPOS, TCON, TDRC
+import os, re, sys, errno, html, json, ipaddress, threading, secrets, time, glob, shutil, subprocess, importlib, importlib.metadata
 from flask import Flask, request, redirect, abort, send_file, jsonify, url_for
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
+from types import MappingProxyType
+
+class LazyModule:
+    """Defers importing a heavy module until first attribute access."""
+    def __init__(self, name):
+        self._name, self._mod, self._lock = name, None, threading.Lock()
+    def __getattr__(self, attr):
+        if self._mod is None:
+            with self._lock:
+                if self._mod is None:
+                    self._mod = importlib.import_module(self._name)
+        return getattr(self._mod, attr)
+
+yt_dlp = LazyModule("yt_dlp")
+requests = LazyModule("requests")
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
@@ -11,24 +27,55 @@ UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like
 HEADERS = {"User-Agent": UA, "Accept": "*/*"}
 ILLEGAL = r'[<>:"/\\|?*]'
 DOWNLOAD_DIR = os.path.abspath("./downloads")
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-
-MAX_WORKERS = 4
-
-for fn in os.listdir(DOWNLOAD_DIR):
-    try: os.remove(os.path.join(DOWNLOAD_DIR, fn))
-    except: pass
+# in-progress artifacts (fragments, .part, unmerged streams, ffmpeg temp files) live here until published
+# RAM staging is opt-in: set DOWNTIL_STAGING_DIR to a tmpfs base such as /dev/shm; we only ever touch our own
+# "downtil" subdir in it. Without it everything stages on disk under DISK_STAGING_DIR.
+STAGING_BASE = os.environ.get("DOWNTIL_STAGING_DIR", "")
+STAGING_DIR = os.path.join(STAGING_BASE, "downtil") if STAGING_BASE else ""
+STAGING_MAX_BYTES = int(os.environ.get("DOWNTIL_STAGING_MAX_MB", "2048")) * 1024 * 1024
+STAGING_HEADROOM = 2        # reserve est_bytes x this in RAM: merges and transcodes hold inputs and output at once
+DISK_STAGING_DIR = os.path.join(DOWNLOAD_DIR, ".staging")  # fallback; not matched by cache globs
+
+MAX_WORKERS = 4             # current worker target; the autoscaler moves it between the bounds below
+MIN_WORKERS = int(os.environ.get("DOWNTIL_MIN_WORKERS", "4"))  # idle workers cost nothing; only CPU pressure sheds them
+MAX_WORKERS_CAP = int(os.environ.get("DOWNTIL_MAX_WORKERS", str(max(4, (os.cpu_count() or 4) * 2))))
+AUTOSCALE_INTERVAL = 15
+AUTOSCALE_CPU_HIGH = 0.9    # busy CPU fraction above which we shed workers
+AUTOSCALE_CPU_LOW = 0.7     # busy CPU fraction below which we may add workers
+AUTOSCALE_WAIT_GROW = 20    # oldest queued job must have waited this long before growing
+AUTOSCALE_COOLDOWN = 60     # let CPU and throughput settle after a resize before judging again
+# cancel queued/running jobs nobody has polled for this long; hidden tabs may only poll once a minute
+ABANDON_GRACE_SECONDS = int(os.environ.get("DOWNTIL_ABANDON_GRACE", "150"))
+AGING_SECONDS = 60          # a queued job's effective size halves every AGING_SECONDS it waits
+DISK_RESERVE_BYTES = 512 * 1024 * 1024
+DEFAULT_JOB_BYTES = 64 * 1024 * 1024  # used when a job has no size estimate
+TRANSCODE_WORKERS = int(os.environ.get("DOWNTIL_TRANSCODE_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+TRANSCODE_MIN_SEGMENT = 20  # seconds; shorter segments cost more in x264 warm-up than they gain
+PROGRESS_UPDATE_HZ = 4      # max progress publishes per job per second (clients poll every 600 ms)
+VERSION_CHECK_INTERVAL = 6 * 3600
+
+PREFETCH_ENABLED = os.environ.get("DOWNTIL_PREFETCH") == "1"  # speculative downloads from detail pages
+PREFETCH_KINDS = {"yt": "yt-audio", "sc": "sc-mp3"}  # most likely click per detail page
+PREFETCH_MAX_SECONDS = 600
+PREFETCH_MAX_BYTES = 64 * 1024 * 1024
+PREFETCH_FREE_SLOTS = 1     # prefetch never takes the last free worker(s)
+PREFETCH_TTL = 15 * 60      # unclaimed prefetch jobs are dropped after this long
 
 PENDING_LOCK = threading.Lock()
 ACTIVE_LOCK = threading.Lock()
 JOBS_LOCK = threading.Lock()
-TASKQ = queue.Queue()
+QUEUE_COND = threading.Condition(PENDING_LOCK)
+QUEUED = {}
 ACTIVE = set()
 JOB_KEYS = {}
 PENDING = []
 JOBS = {}
-
-app = Flask(__name__)
+JOB_PROCS = {}
+_CURRENT = threading.local()
+STAGING_LOCK = threading.Lock()
+STAGED = {}  # jid -> (dir, reserved bytes in STAGING_DIR)
+PREFETCH_STATS = {"started": 0, "hits": 0, "completed": 0, "expired": 0, "wasted_bytes": 0}
+PREFETCH_FILES = {}  # finished, not yet claimed prefetch outputs -> size
 
 # ---------------- utils ----------------
 
@@ -37,17 +84,30 @@ ADMIN_IPS = ["192.168.1.170", "127.0.0.1"]
 def is_local(ip):
     return ip in ADMIN_IPS
 
-def ytdlp_updated() -> bool:
+VERSION_INFO = {"local": None, "latest": None, "checked": 0.0}
+
+def refresh_ytdlp_version():
     try:
-        local = importlib.metadata.version("yt-dlp")
+        VERSION_INFO["local"] = importlib.metadata.version("yt-dlp")
     except importlib.metadata.PackageNotFoundError:
-        return False  # not installed
+        VERSION_INFO["local"] = None  # not installed
+    try:
+        resp = requests.get("https://pypi.org/pypi/yt-dlp/json", headers=HEADERS, timeout=5)
+        resp.raise_for_status()
+        VERSION_INFO["latest"] = resp.json()["info"]["version"]
+        VERSION_INFO["checked"] = time.time()
+    except Exception as e:
+        app.logger.warning(f"yt-dlp version check failed: {e}")
 
-    resp = requests.get("https://pypi.org/pypi/yt-dlp/json", timeout=5)
-    resp.raise_for_status()
-    latest = resp.json()["info"]["version"]
+def version_check_loop():
+    while True:
+        refresh_ytdlp_version()
+        time.sleep(VERSION_CHECK_INTERVAL)
 
-    return local == latest, local, latest
+def ytdlp_updated():
+    # served from VERSION_INFO; version_check_loop keeps it fresh so /server/ never blocks on PyPI
+    local, latest = VERSION_INFO["local"], VERSION_INFO["latest"]
+    return (latest is None or local == latest), local or "not installed", latest or "unknown"
 
 @app.route("/server/")
 def admin():
@@ -65,8 +125,119 @@ def admin():
             <h2 {hmsg}>Latest: {latestver}</h2>
         <br>
     </div>
+    {timings_card()}
+    {breakers_card()}
+    {workers_card()}
+    {shedding_card()}
+    {prefetch_card()}
     """, "Server Status", "Stats are not live and only show details from time of page load.")
 
+def shedding_card():
+    st = dict(SHED_STATS)
+    return f"""
+    <div class="card" style="margin-top:16px">
+        <h1>Bot shedding</h1>
+        <h2>Rejected requests: {st['rejected']} • Honeypot hits: {st['honeypot_hits']} • Strike blocks: {st['strike_blocks']}</h2>
+        <h2>Blocked IPs: {len(BLOCKED_IPS)} • Blocked UAs: {len(BLOCKED_UAS)} • IPs with strikes: {len(STRIKES)}</h2>
+    </div>"""
+
+def workers_card():
+    cpu = AUTOSCALE["cpu"]
+    return f"""
+    <div class="card" style="margin-top:16px">
+        <h1>Workers</h1>
+        <h2>Target: {MAX_WORKERS}{' pinned' if AUTOSCALE['pinned'] else ''} (bounds {MIN_WORKERS}–{MAX_WORKERS_CAP}) • Active: {len(ACTIVE)} • Queued: {len(PENDING)}</h2>
+        <h2>CPU busy: {'n/a' if cpu is None else f'{cpu:.0%}'} • Throughput: {human_bps(AUTOSCALE['throughput'])} • Oldest wait: {AUTOSCALE['oldest_wait']:.0f}s</h2>
+        <h2>Last change: {html.escape(AUTOSCALE['last_change'] or 'none')}</h2>
+        <form class="btns" method="post" action="/server/workers">
+            <input class="btn" name="min" size="3" placeholder="min {MIN_WORKERS}">
+            <input class="btn" name="max" size="3" placeholder="max {MAX_WORKERS_CAP}">
+            <input class="btn" name="target" size="3" placeholder="now {MAX_WORKERS} / auto">
+            <button class="btn" type="submit">Apply</button>
+        </form>
+    </div>"""
+
+def prefetch_card():
+    st = dict(PREFETCH_STATS)
+    rate = f"{st['hits'] / st['started'] * 100:.0f}%" if st["started"] else "n/a"
+    return f"""
+    <div class="card" style="margin-top:16px">
+        <h1>Prefetch {'(on)' if PREFETCH_ENABLED else '(off)'}</h1>
+        <h2>Started: {st['started']} • Completed: {st['completed']} • Hits: {st['hits']} • Hit rate: {rate}</h2>
+        <h2>Expired: {st['expired']} • Wasted: {st['wasted_bytes'] / 1048576:.1f} MB</h2>
+    </div>"""
+
+def breakers_card():
+    rows = "".join(
+        f"<tr><td>{p}</td><td>{'OPEN since ' + time.strftime('%H:%M:%S', time.localtime(b['opened'])) if b['open'] else 'closed'}</td>"
+        f"<td>{sum(1 for _, o in list(b['events']) if not o)}/{len(b['events'])}</td></tr>"
+        for p, b in BREAKERS.items())
+    return f"""
+    <div class="card" style="margin-top:16px">
+        <h1>Extractors</h1>
+        <table class="small" style="width:100%;text-align:left">
+            <tr><th>Platform</th><th>Circuit</th><th>Failures (last {BREAKER_WINDOW}s)</th></tr>
+            {rows}
+        </table>
+        <h2 style="margin-top:10px">Negative cache: {len(NEG_CACHE)} ids</h2>
+    </div>"""
+
+def timings_card():
+    rows = "".join(
+        f"<tr><td>{html.escape(n)}</td><td>{a['count']}</td><td>{a['mean']:.2f}s</td><td>{a['max']:.2f}s</td><td>{a['total']:.1f}s</td></tr>"
+        for n, a in timeline_aggregates().items())
+    return f"""
+    <div class="card" style="margin-top:16px">
+        <h1>Job phases</h1>
+        <table class="small" style="width:100%;text-align:left">
+            <tr><th>Phase</th><th>Count</th><th>Mean</th><th>Max</th><th>Total</th></tr>
+            {rows or '<tr><td colspan="5">No finished phases yet</td></tr>'}
+        </table>
+        <h2 style="margin-top:10px"><a class="link" href="/server/timings">JSON</a> • <a class="link" href="/server/profile?seconds=10">Profile 10s</a></h2>
+    </div>"""
+
+@app.route("/server/timings")
+def admin_timings():
+    if not is_local(request.remote_addr):
+        return abort(403)
+    return jsonify(timeline_aggregates())
+
+PROFILE_LOCK = threading.Lock()
+PROFILE_MAX_SECONDS = 60
+
+@app.route("/server/profile")
+def admin_profile():
+    """Sample every thread's stack for ?seconds=N and return collapsed stacks (flamegraph.pl / speedscope)."""
+    if not is_local(request.remote_addr):
+        return abort(403)
+    try: secs = min(max(float(request.args.get("seconds", 10)), 0.1), PROFILE_MAX_SECONDS)
+    except ValueError: secs = 10
+    try: interval = min(max(float(request.args.get("interval", 0.01)), 0.001), 1.0)
+    except ValueError: interval = 0.01
+    if not PROFILE_LOCK.acquire(blocking=False):
+        return jsonify({"error": "profile already running"}), 409
+    try:
+        me = threading.get_ident()
+        counts = {}
+        end = time.time() + secs
+        while time.time() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me: continue
+                stack = []
+                while frame is not None:
+                    co = frame.f_code
+                    stack.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                key = ";".join([names.get(tid, str(tid))] + stack[::-1])
+                counts[key] = counts.get(key, 0) + 1
+            time.sleep(interval)
+    finally:
+        PROFILE_LOCK.release()
+    out = "\n".join(f"{k} {v}" for k, v in sorted(counts.items()))
+    return app.response_class(out + "\n", mimetype="text/plain",
+                              headers={"Content-Disposition": "attachment; filename=downtil-profile.folded"})
+
 def sanitize(name: str, ext: str = ""):
     name = (name or "download").strip()
     name = re.sub(ILLEGAL, "_", name).rstrip(".")
@@ -76,6 +247,78 @@ def redirect_home(reason: str):
     app.logger.warning(reason)
     return redirect("/")
 
+# ---------- bot shedding ----------
+BLOCK_SECONDS = 3600
+STRIKE_WINDOW = 300
+STRIKE_LIMIT = 5            # item-level extraction failures (bad ids) per IP within STRIKE_WINDOW before blocking
+SHED_LOCK = threading.Lock()
+BLOCKED_IPS = {}            # ip -> expiry
+BLOCKED_UAS = {}            # (user-agent fingerprint, network prefix) -> expiry; honeypot hits only
+STRIKES = {}                # ip -> deque of timestamps
+SHED_STATS = {"rejected": 0, "honeypot_hits": 0, "strike_blocks": 0}
+
+def ua_fingerprint(ip, ua):
+    """Key for UA blocks: a non-browser UA within the client's /24 (IPv6 /64).
+
+    Scoped to the network so one scanner using python-requests or curl doesn't lock out every API
+    client with the same UA. Browsers and clients without a UA are never blocked this way.
+    """
+    ua = (ua or "").strip().lower()
+    if not ua or ua.startswith("mozilla/") or not ip: return None
+    try:
+        net = ipaddress.ip_network(f"{ip}/{24 if ':' not in ip else 64}", strict=False)
+    except ValueError:
+        return None
+    return (ua, str(net))
+
+def block_client(ip, ua=None, seconds=BLOCK_SECONDS):
+    """Block an IP; with `ua` (honeypot hits only) also block that UA within the IP's network."""
+    if is_local(ip): return
+    until = time.time() + seconds
+    with SHED_LOCK:
+        for table in (BLOCKED_IPS, BLOCKED_UAS):
+            if len(table) > 10000:
+                for k, v in list(table.items()):
+                    if v < time.time(): table.pop(k, None)
+        BLOCKED_IPS[ip] = until
+        fp = ua_fingerprint(ip, ua) if ua else None
+        if fp is not None: BLOCKED_UAS[fp] = until
+
+def record_strike():
+    try: ip = request.remote_addr
+    except RuntimeError: return  # outside a request
+    if not ip or is_local(ip): return
+    now = time.time()
+    with SHED_LOCK:
+        q = STRIKES.setdefault(ip, deque())
+        q.append(now)
+        while q and q[0] < now - STRIKE_WINDOW: q.popleft()
+        hit = len(q) >= STRIKE_LIMIT
+        if hit: STRIKES.pop(ip, None)
+        if len(STRIKES) > 10000:
+            for k, v in list(STRIKES.items()):
+                if not v or v[-1] < now - STRIKE_WINDOW: STRIKES.pop(k, None)
+    if hit:
+        SHED_STATS["strike_blocks"] += 1
+        block_client(ip)
+        app.logger.warning(f"blocked {ip}: {STRIKE_LIMIT} invalid requests in {STRIKE_WINDOW}s")
+
+def is_blocked(ip, ua):
+    now = time.time()
+    for table, key in ((BLOCKED_IPS, ip), (BLOCKED_UAS, ua_fingerprint(ip, ua))):
+        until = table.get(key) if key is not None else None
+        if until:
+            if until > now: return True
+            with SHED_LOCK: table.pop(key, None)
+    return False
+
+@app.before_request
+def shed_blocked():
+    # runs before any route handler, so blocked scanners never reach an extractor
+    if is_blocked(request.remote_addr, request.headers.get("User-Agent")):
+        SHED_STATS["rejected"] += 1
+        return "", 403
+
 COOKIES_PATH = os.path.abspath(os.environ.get("COOKIES_FILE", "./cookies.txt"))
 COOKIES_OK = os.path.isfile(COOKIES_PATH)
 if COOKIES_OK:
@@ -92,7 +335,7 @@ def ydl_opts_base(extra=None, outtmpl=None):
 
         "paths": {"home": DOWNLOAD_DIR, "temp": DOWNLOAD_DIR},
 
-        "outtmpl": outtmpl or os.path.join(DOWNLOAD_DIR, "%(title).200B [%(id)s].%(ext)s"),
+        "outtmpl": outtmpl or "%(title).200B [%(id)s].%(ext)s",
 
         "merge_output_format": "mp4",
         "concurrent_fragment_downloads": 1,
@@ -113,15 +356,20 @@ def ydl_opts_base(extra=None, outtmpl=None):
         base.update(extra)
     return base
 
+Progress = namedtuple("Progress", ["progress", "speed", "eta"])
+
 def new_job(kind, title="Preparing…", key=None, display_name=None):
     jid = secrets.token_hex(8)
     with JOBS_LOCK:
         JOBS[jid] = {
             "id": jid, "kind": kind, "title": title,
-            "stage": "queued", "progress": 0.0, "speed": 0.0,
-            "eta": None, "filename": None, "filepath": None,
+            "stage": "queued", "live": Progress(0.0, 0.0, None), "published": 0.0,
+            "filename": None, "filepath": None,
             "display_name": display_name,
-            "error": None, "created": time.time(), "key": key
+            "error": None, "created": time.time(), "key": key,
+            "last_seen": time.time(), "cancelled": False, "vid": None,
+            "est_bytes": None, "duration": None, "spans": [], "prefetch": False,
+            "api_until": None
         }
     if key:
         with JOBS_LOCK:
@@ -132,6 +380,46 @@ def set_job(jid, **kw):
     with JOBS_LOCK:
         if jid in JOBS: JOBS[jid].update(kw)
 
+def touch_job(jid):
+    # any status poll, file stream or dedupe follower keeps a job alive
+    with JOBS_LOCK:
+        if jid in JOBS: JOBS[jid]["last_seen"] = time.time()
+
+# ---------- job timeline ----------
+def mark_phase(jid, name):
+    """Close the job's open span (if any) and open `name`; no-op if it's already open."""
+    j = JOBS.get(jid)
+    if not j: return
+    spans = j["spans"]
+    if spans and spans[-1][2] is None and spans[-1][0] == name: return
+    now = time.time()
+    with JOBS_LOCK:
+        if spans and spans[-1][2] is None: spans[-1][2] = now
+        if name: spans.append([name, now, None])
+
+def end_phase(jid):
+    mark_phase(jid, None)
+
+def job_timeline(j):
+    now = time.time()
+    return [{"phase": n, "start": round(a - j["created"], 3),
+             "seconds": round((b or now) - a, 3), "open": b is None}
+            for n, a, b in list(j.get("spans") or [])]
+
+def timeline_aggregates():
+    agg = {}
+    with JOBS_LOCK:
+        spans = [sp for j in JOBS.values() for sp in j.get("spans") or [] if sp[2] is not None]
+    for n, a, b in spans:
+        c = agg.setdefault(n, [0, 0.0, 0.0])
+        c[0] += 1; c[1] += b - a; c[2] = max(c[2], b - a)
+    return {n: {"count": c, "total": round(t, 2), "mean": round(t / c, 2), "max": round(m, 2)}
+            for n, (c, t, m) in sorted(agg.items(), key=lambda kv: -kv[1][1])}
+
+def job_cancelled(jid):
+    j = JOBS.get(jid)
+    return bool(j and j.get("cancelled"))
+
 def human_bps(bps):
     try: bps = float(bps or 0)
     except: bps = 0
@@ -149,6 +437,78 @@ def platform_detect(url):
     if "soundcloud.com" in host: return "sc"
     return None
 
+# ---------- URL canonicalization ----------
+YT_ID = r"[A-Za-z0-9_-]{11}"
+TT_ID = r"[0-9]{1,25}"
+SC_ID = r"[0-9]{1,20}"      # api.soundcloud.com track id
+SC_RESERVED = {"sets", "likes", "tracks", "albums", "reposts", "followers", "following",
+               "popular-tracks", "comments", "spotlight", "discover", "search", "stations", "you"}
+SHORT_HOSTS = ("vm.tiktok.com", "vt.tiktok.com", "on.soundcloud.com")
+SHORT_TTL = 24 * 3600
+SHORT_LOCK = threading.Lock()
+SHORT_CACHE = {}
+
+def canonicalize(url, resolve=True):
+    """Map a pasted link to (platform, id) from its shape alone; short links cost one cached HEAD."""
+    try: u = urlparse(url)
+    except ValueError: return None
+    host = u.netloc.lower().split(":")[0]
+    if host.startswith("www."): host = host[4:]
+    parts = [p for p in u.path.split("/") if p]
+    if host in SHORT_HOSTS:
+        target = resolve_short(url) if resolve else None
+        return canonicalize(target, resolve=False) if target else None
+    if host == "youtu.be":
+        if parts and re.fullmatch(YT_ID, parts[0]): return ("yt", parts[0])
+    elif host in ("youtube.com", "m.youtube.com", "music.youtube.com", "youtube-nocookie.com"):
+        if parts[:1] == ["watch"]:
+            v = parse_qs(u.query).get("v", [""])[0]
+            if re.fullmatch(YT_ID, v): return ("yt", v)
+        elif len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v") and re.fullmatch(YT_ID, parts[1]):
+            return ("yt", parts[1])
+    elif host in ("tiktok.com", "m.tiktok.com"):
+        if len(parts) >= 3 and parts[0].startswith("@") and parts[1] == "video" and re.fullmatch(TT_ID, parts[2]):
+            return ("tt", parts[2])
+    elif host in ("soundcloud.com", "m.soundcloud.com"):
+        if len(parts) == 2 and parts[1] not in SC_RESERVED and parts[0] not in SC_RESERVED:
+            return ("sc", f"{parts[0]}/{parts[1]}")
+    elif host == "api.soundcloud.com":
+        if len(parts) == 2 and parts[0] == "tracks" and re.fullmatch(SC_ID, parts[1]):
+            return ("sc", parts[1])
+    return None
+
+def valid_id(pattern, vid):
+    """Shape-check an id from the path; junk ids are a scanner's strike, never an extractor call."""
+    if re.fullmatch(pattern, vid): return True
+    record_strike()
+    return False
+
+def resolve_short(url):
+    now = time.time()
+    with SHORT_LOCK:
+        hit = SHORT_CACHE.get(url)
+        if hit and now - hit[0] < SHORT_TTL: return hit[1]
+    try:
+        r = requests.head(url, headers=HEADERS, allow_redirects=True, timeout=5)
+        target = r.url if r.url != url else None
+    except requests.RequestException:
+        return None
+    with SHORT_LOCK:
+        if len(SHORT_CACHE) > 4096: SHORT_CACHE.clear()
+        SHORT_CACHE[url] = (now, target)
+    return target
+
+def canonical_path(c):
+    p, cid = c
+    if p == "yt": return f"/yt/{cid}"
+    if p == "tt": return f"/tt/{cid}"
+    if p == "sc" and "/" in cid: return f"/sc/{cid}"
+    return None
+
+def cache_key(url):
+    c = canonicalize(url, resolve=False)
+    return f"{c[0]}:{c[1]}" if c else url
+
 def pick_thumb(info):
     if info.get("thumbnail"): return info["thumbnail"]
     ts = info.get("thumbnails") or []
@@ -157,18 +517,218 @@ def pick_thumb(info):
         return ts[-1].get("url")
     return None
 
-def max_height(info):
-    m = 0
+def fmt_bytes(f, duration=None):
+    b = f.get("filesize") or f.get("filesize_approx")
+    if b: return int(b)
+    tbr = f.get("tbr") or ((f.get("vbr") or 0) + (f.get("abr") or 0))
+    if tbr and duration: return int(tbr * 1000 / 8 * duration)
+    return 0
+
+# ---------- media summary ----------
+TAG_KEYS = ("artist", "uploader", "creator", "uploader_id", "album", "playlist_title", "album_title",
+            "track_number", "playlist_index", "disc_number", "release_date", "upload_date", "genre")
+
+MediaSummary = namedtuple("MediaSummary", [
+    "id", "title", "description", "uploader", "creator", "duration",
+    "max_height", "best_audio_kbps", "h264_heights", "default_sub", "thumb",
+    "native_audio", "est_bytes", "tags",
+])
+
+def media_summary(info):
+    """Walk an info dict once and keep only what routes and jobs need."""
+    dur = info.get("duration") or 0
+    mh, kbps, aud_b, vid_b, vid_hd_b = 0, 0, 0, 0, 0
+    h264 = set()
+    native = {}  # codec label -> best kbps; labelled the way native_audio_opts selects (AAC first, then Opus)
     for f in info.get("formats") or []:
+        vc, ac = f.get("vcodec"), f.get("acodec")
         h = f.get("height") or 0
-        if h and h > m: m = h
-    return m
+        b = fmt_bytes(f, dur)
+        if h > mh: mh = h
+        if vc in (None, "none"):
+            if ac not in (None, "none"):
+                kbps = max(kbps, f.get("abr") or f.get("tbr") or 0)
+                aud_b = max(aud_b, b)
+                codec = "AAC" if ac.startswith("mp4a") else "Opus" if ac.startswith("opus") else None
+                rate = f.get("abr") or f.get("tbr") or 0
+                if codec and rate >= native.get(codec, -1):
+                    native[codec] = rate
+            continue
+        vid_b = max(vid_b, b)
+        if h <= 1080: vid_hd_b = max(vid_hd_b, b)
+        if vc.startswith("avc1") and (f.get("ext") == "mp4" or f.get("container") == "mp4"):
+            h264.add(h)
+
+    # rough peak disk usage per kind: source streams plus the finished output
+    whole = fmt_bytes(info, dur)
+    mp3 = (aud_b or whole) + int(dur * 320 * 1000 / 8)
+    est = {
+        "yt-highest": (vid_b + aud_b or whole) * 2,
+        "yt-hd": (vid_hd_b + aud_b or whole) * 2,
+        "yt-highest-x264": (vid_b + aud_b or whole) * 3,  # source, segments and output coexist
+        "yt-hd-x264": (vid_hd_b + aud_b or whole) * 3,
+        "yt-audio": mp3,
+        "tt-video": (vid_b + aud_b or whole) * 2,
+        "sc-mp3": mp3,
+        "yt-native": aud_b or whole,
+        "sc-native": aud_b or whole,
+    }
+    return MediaSummary(
+        id=info.get("id"),
+        title=info.get("title"),
+        description=(info.get("description") or "")[:200] or None,
+        uploader=info.get("uploader"),
+        creator=info.get("uploader") or info.get("channel") or info.get("artist"),
+        duration=info.get("duration"),
+        max_height=mh,
+        best_audio_kbps=int(round(kbps)) or None,
+        h264_heights=frozenset(h264),
+        default_sub=default_sub(info),
+        thumb=pick_thumb(info),
+        native_audio=next(((c, int(round(native[c])) or None) for c in ("AAC", "Opus") if c in native), None),
+        est_bytes=MappingProxyType({k: v for k, v in est.items() if v}),
+        tags=MappingProxyType({k: info[k] for k in TAG_KEYS if info.get(k) is not None}),
+    )
 
-def best_audio_kbps(info):
-    auds = [f for f in (info.get("formats") or []) if f.get("vcodec") in (None,"none") and f.get("acodec") not in (None,"none")]
-    if not auds: return None
-    a = max(auds, key=lambda f: (f.get("abr") or f.get("tbr") or 0))
-    return int(round(a.get("abr") or a.get("tbr") or 0)) or None
+SUMMARY_TTL = 600
+SUMMARY_CACHE_MAX = 2048
+SUMMARY_LOCK = threading.Lock()
+SUMMARY_CACHE = {}
+
+# ---------- extraction guards ----------
+EXTRACT_TIMEOUT = 25         # seconds a request thread waits on extract_info
+NEGATIVE_TTL = 120           # failed ids are answered from cache for this long
+BREAKER_WINDOW = 60          # seconds of outcomes a breaker looks at
+BREAKER_MIN_CALLS = 6
+BREAKER_FAIL_RATIO = 0.6
+BREAKER_PROBE_INTERVAL = 30
+BREAKER_PROBES = {
+    "yt": "https://www.youtube.com/watch?v=jNQXAC9IVRw",
+    "tt": "https://www.tiktok.com/@scout2015/video/6718335390845095173",
+    "sc": "https://soundcloud.com/ethmusic/lostin-powers-she-so-heavy",
+}
+# item-level errors: the platform answered, the id is just bad
+ITEM_ERRORS = ("unsupported url", "video unavailable", "does not exist", "not found", "404", "private",
+               "removed", "is not a valid", "incomplete youtube id", "looks truncated",
+               "confirm your age", "requested format is not available")
+# throttling / outage responses always count against the platform, whatever else the message says
+UPSTREAM_HTTP = re.compile(r"http error (429|5\d\d)")
+
+EXTRACT_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="extract")
+NEG_LOCK = threading.Lock()
+NEG_CACHE = {}
+BREAKER_LOCK = threading.Lock()
+BREAKERS = {p: {"open": False, "opened": 0.0, "events": deque()} for p in BREAKER_PROBES}
+
+def _extract(url):
+    with yt_dlp.YoutubeDL(ydl_opts_base({"socket_timeout": 10})) as y:
+        return media_summary(y.extract_info(url, download=False))
+
+LOCAL_ERRNOS = (errno.ENOSPC, errno.EDQUOT, errno.EROFS, errno.EACCES)
+
+def is_local_failure(err):
+    """Our own ffmpeg or filesystem failed; that says nothing about the platform."""
+    inner = (getattr(err, "exc_info", None) or (None, None))[1] or err
+    if isinstance(inner, yt_dlp.utils.PostProcessingError): return True
+    if "postprocessing:" in str(err).lower(): return True
+    return isinstance(inner, OSError) and inner.errno in LOCAL_ERRNOS
+
+def is_upstream_failure(err):
+    msg = str(err).lower()
+    if UPSTREAM_HTTP.search(msg): return True
+    return not any(s in msg for s in ITEM_ERRORS)
+
+def breaker_open(p):
+    b = BREAKERS.get(p)
+    return bool(b and b["open"])
+
+def breaker_record(p, ok):
+    b = BREAKERS.get(p)
+    if not b: return
+    now = time.time()
+    with BREAKER_LOCK:
+        ev = b["events"]
+        ev.append((now, ok))
+        while ev and ev[0][0] < now - BREAKER_WINDOW: ev.popleft()
+        fails = sum(1 for _, o in ev if not o)
+        if not b["open"] and len(ev) >= BREAKER_MIN_CALLS and fails / len(ev) >= BREAKER_FAIL_RATIO:
+            b["open"], b["opened"] = True, now
+            app.logger.warning(f"circuit open for {p}: {fails}/{len(ev)} extractions failed")
+
+def breaker_close(p):
+    with BREAKER_LOCK:
+        b = BREAKERS[p]
+        b["open"] = False
+        b["events"].clear()
+    app.logger.info(f"circuit closed for {p}")
+    with QUEUE_COND:
+        QUEUE_COND.notify_all()
+
+def breaker_probe_loop():
+    while True:
+        time.sleep(BREAKER_PROBE_INTERVAL)
+        for p, url in BREAKER_PROBES.items():
+            if not breaker_open(p): continue
+            fut = EXTRACT_POOL.submit(_extract, url)
+            try:
+                fut.result(timeout=EXTRACT_TIMEOUT)
+            except FutureTimeout:
+                fut.cancel()
+                app.logger.info(f"circuit probe for {p} timed out")
+                continue
+            except Exception as e:
+                if is_upstream_failure(e):
+                    app.logger.info(f"circuit probe for {p} failed: {e}")
+                    continue
+                # the platform answered; only the probe item itself is gone
+                app.logger.warning(f"circuit probe item for {p} is unavailable ({e}); update BREAKER_PROBES")
+            breaker_close(p)
+
+def extract_summary(url):
+    now = time.time()
+    key = cache_key(url)
+    with SUMMARY_LOCK:
+        hit = SUMMARY_CACHE.get(key)
+        if hit and now - hit[0] < SUMMARY_TTL:
+            return hit[1]
+    with NEG_LOCK:
+        neg = NEG_CACHE.get(key)
+        if neg and now - neg[0] < NEGATIVE_TTL:
+            if neg[2]: record_strike()
+            raise RuntimeError(neg[1])
+    p = platform_detect(url)
+    if breaker_open(p):
+        raise RuntimeError(f"{p} is temporarily unavailable, try again later")
+    try:
+        fut = EXTRACT_POOL.submit(_extract, url)
+        meta = fut.result(timeout=EXTRACT_TIMEOUT)
+    except FutureTimeout:
+        fut.cancel()  # don't let a still-queued call run later and starve fresh requests
+        breaker_record(p, False)
+        raise RuntimeError(f"extraction timed out after {EXTRACT_TIMEOUT}s")
+    except Exception as e:
+        item = not is_upstream_failure(e)
+        breaker_record(p, item)
+        with NEG_LOCK:
+            if len(NEG_CACHE) > 4096:
+                for k, (ts, *_) in list(NEG_CACHE.items()):
+                    if now - ts >= NEGATIVE_TTL: NEG_CACHE.pop(k, None)
+            NEG_CACHE[key] = (now, str(e), item)
+        # only bad ids count toward blocking; outages, timeouts and open breakers are not the client's fault
+        if item: record_strike()
+        raise
+    breaker_record(p, True)
+    with SUMMARY_LOCK:
+        if len(SUMMARY_CACHE) >= SUMMARY_CACHE_MAX:
+            for k, (ts, _) in list(SUMMARY_CACHE.items()):
+                if now - ts >= SUMMARY_TTL: SUMMARY_CACHE.pop(k, None)
+            if len(SUMMARY_CACHE) >= SUMMARY_CACHE_MAX:
+                SUMMARY_CACHE.pop(next(iter(SUMMARY_CACHE)))
+        SUMMARY_CACHE[key] = (now, meta)
+        if p and meta.id:
+            # alias under the platform id so /sc/<user>/<track> and /sc/<sid>/... share one entry
+            SUMMARY_CACHE[f"{p}:{meta.id}"] = (now, meta)
+    return meta
 
 def default_sub(info):
     lang = (info.get("language") or "").split("-")[0] or None
@@ -183,9 +743,7 @@ def default_sub(info):
         s = autos[k][0]; return (s.get("url"), s.get("ext") or "vtt", k)
     return (None, None, None)
 
-from mutagen.id3 import ID3, ID3NoHeaderError, TPE1, TPE2, TALB, TIT2, TRCK, TPOS, TCON, TDRC, COMM
-
-def is_sc_url_comment(comm_frame: COMM) -> bool:
+def is_sc_url_comment(comm_frame) -> bool:
     try:
         t = (comm_frame.text or [""])[0]
         return ("soundcloud.com/" in t) or t.startswith("https://api.soundcloud.com/") or t.startswith("http://api.soundcloud.com/")
@@ -205,14 +763,36 @@ def valid_genre_value(info, artist_guess):
         return None
     return g
 
-def sc_write_id3(mp3_path, info):
+ARTWORK_MAX_BYTES = 5 * 1024 * 1024
+
+def fetch_artwork(url):
+    """Download cover art once for APIC; returns (mime, bytes) or None. ID3 players want JPEG/PNG."""
+    if not url: return None
+    if "/vi_webp/" in url and url.endswith(".webp"):
+        url = url.replace("/vi_webp/", "/vi/")[:-5] + ".jpg"  # YouTube serves the same thumbnail as JPEG
+    try:
+        r = requests.get(url, headers=HEADERS, timeout=10)
+        if r.status_code >= 400 or len(r.content) > ARTWORK_MAX_BYTES: return None
+    except requests.RequestException:
+        return None
+    ct = (r.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+    if ct not in ("image/jpeg", "image/jpg", "image/png"):
+        if r.content[:3] == b"\xff\xd8\xff": ct = "image/jpeg"
+        elif r.content[:8] == b"\x89PNG\r\n\x1a\n": ct = "image/png"
+        else: return None
+    return ("image/jpeg" if ct == "image/jpg" else ct), r.content
+
+def write_id3(mp3_path, meta, artwork=None):
+    """Write every ID3 frame, cover art included, in a single mutagen save."""
+    from mutagen.id3 import ID3, ID3NoHeaderError, TPE1, TPE2, TALB, TIT2, TRCK, TPOS, TCON, TDRC, APIC
     try:
         try:
             tags = ID3(mp3_path)
         except ID3NoHeaderError:
             tags = ID3()
 
-        title = info.get("title") or os.path.splitext(os.path.basename(mp3_path))[0]
+        info = meta.tags
+        title = meta.title or os.path.splitext(os.path.basename(mp3_path))[0]
         artist = (info.get("artist") or info.get("uploader") or info.get("creator") or info.get("uploader_id") or "Unknown")
 
         album = (info.get("album") or info.get("playlist_title") or info.get("album_title") or None)
@@ -251,6 +831,10 @@ def sc_write_id3(mp3_path, info):
         if date_tag:
             tags.delall("TDRC"); tags.add(TDRC(encoding=3, text=date_tag))
 
+        if artwork:
+            mime, data = artwork
+            tags.delall("APIC"); tags.add(APIC(encoding=3, mime=mime, type=3, desc="Cover", data=data))
+
         tags.save(mp3_path)
     except Exception:
         pass
@@ -263,6 +847,10 @@ def tag_for(kind):
         "yt-audio": "mp3",
         "tt-video": "video",
         "sc-mp3": "mp3",
+        "yt-native": "native",
+        "sc-native": "native",
+        "yt-highest-x264": "highest-x264",
+        "yt-hd-x264": "hd-x264",
     }.get(kind)
 
 def ext_for_kind(kind):
@@ -272,115 +860,529 @@ def ext_for_kind(kind):
         "yt-audio": "mp3",
         "tt-video": "mp4",
         "sc-mp3": "mp3",
+        "yt-native": "m4a",  # or opus; run_download fixes the display name to the real extension
+        "sc-native": "m4a",
+        "yt-highest-x264": "mp4",
+        "yt-hd-x264": "mp4",
     }.get(kind, "mp4")
 
+def match_ext(disp, path):
+    # native audio may come out .opus rather than .m4a; name the download after the real file
+    real = os.path.splitext(path)[1]
+    if real and os.path.splitext(disp)[1].lower() != real.lower():
+        return os.path.splitext(disp)[0] + real
+    return disp
+
 def find_existing_by_id(vid, tag):
     pat = os.path.join(DOWNLOAD_DIR, f"*[{vid}]*[{tag}].*")
     matches = sorted(glob.glob(pat), key=lambda p: os.path.getmtime(p), reverse=True)
     return matches[0] if matches else None
 
 def outtmpl_with_tag(tag):
-    return os.path.join(DOWNLOAD_DIR, f"%(title).200B [%(id)s] [{tag}].%(ext)s")
+    return f"%(title).200B [%(id)s] [{tag}].%(ext)s"
+
+# ---------- chunked transcoding ----------
+TRANSCODE_SLOTS = threading.BoundedSemaphore(TRANSCODE_WORKERS)  # shared by all jobs
+X264_ARGS = ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-profile:v", "high", "-level", "4.1", "-threads", "2"]
+
+def run_ffmpeg(jid, args):
+    if job_cancelled(jid):
+        raise yt_dlp.utils.DownloadCancelled("Cancelled (no watchers)")
+    p = subprocess.Popen([shutil.which("ffmpeg") or "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *args],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    with JOBS_LOCK:
+        JOB_PROCS.setdefault(jid, set()).add(p)
+    _, err = p.communicate()
+    with JOBS_LOCK:
+        JOB_PROCS.get(jid, set()).discard(p)
+    if job_cancelled(jid):
+        raise yt_dlp.utils.DownloadCancelled("Cancelled (no watchers)")
+    if p.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {err.decode(errors='replace').strip()[-300:]}")
+
+def segment_transcode(jid, src, stage, duration=None):
+    """Split at keyframes, encode segments to H.264 in parallel, then concat losslessly into a faststart MP4."""
+    seg_dir = os.path.join(stage, "segments")
+    os.makedirs(seg_dir, exist_ok=True)
+    seg_len = max(TRANSCODE_MIN_SEGMENT, int((duration or 0) / (TRANSCODE_WORKERS * 4)) or 0)
+
+    mark_phase(jid, "split")
+    set_job(jid, stage="splitting…")
+    # stream copy can only cut on keyframes, so segments start on one and decode independently
+    run_ffmpeg(jid, ["-i", src, "-map", "0:v:0", "-c", "copy", "-f", "segment", "-segment_time", str(seg_len),
+                     "-reset_timestamps", "1", os.path.join(seg_dir, "in%05d.mkv")])
+    segs = sorted(f for f in os.listdir(seg_dir) if f.startswith("in"))
+    if not segs:
+        raise RuntimeError("transcode: no segments produced")
+
+    mark_phase(jid, "encode")
+    done = [0]
+    failed = threading.Event()
+    def encode(name):
+        with TRANSCODE_SLOTS:
+            if failed.is_set(): return  # don't spend a shared slot on a job that already failed
+            run_ffmpeg(jid, ["-i", os.path.join(seg_dir, name), *X264_ARGS, "-an",
+                             os.path.join(seg_dir, "out" + name[2:])])
+        with JOBS_LOCK:
+            done[0] += 1
+        set_job(jid, stage=f"transcoding {done[0]}/{len(segs)}",
+                live=Progress(done[0] * 100.0 / len(segs), 0.0, None))
+    pool = ThreadPoolExecutor(max_workers=min(TRANSCODE_WORKERS, len(segs)), thread_name_prefix=f"x264-{jid[:4]}")
+    try:
+        for fut in as_completed([pool.submit(encode, n) for n in segs]):
+            fut.result()
+    except BaseException:
+        # first failure: drop queued segments and kill the encodes still running for this job
+        failed.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+        terminate_job_procs(jid)
+        raise
+    finally:
+        pool.shutdown(wait=True)
+
+    mark_phase(jid, "concat")
+    set_job(jid, stage="joining…")
+    listing = os.path.join(seg_dir, "list.txt")
+    with open(listing, "w", encoding="utf-8") as fh:
+        fh.writelines(f"file '{os.path.join(seg_dir, 'out' + n[2:])}'\n" for n in segs)
+    out = os.path.splitext(src)[0] + ".mp4"
+    if out == src: out = os.path.splitext(src)[0] + ".h264.mp4"
+    run_ffmpeg(jid, ["-f", "concat", "-safe", "0", "-i", listing, "-i", src,
+                     "-map", "0:v:0", "-map", "1:a:0?", "-c:v", "copy", "-c:a", "aac", "-b:a", "192k",
+                     "-movflags", "+faststart", out])
+    shutil.rmtree(seg_dir, ignore_errors=True)
+    os.remove(src)
+    return out
+
+# ---------- staging ----------
+def acquire_staging(jid, ram=True):
+    """Pick a per-job work dir: RAM-backed STAGING_DIR while it has room, else DOWNLOAD_DIR/.staging.
+
+    Only jobs with a size estimate go to RAM; an unknown size could be many GB.
+    """
+    est = (JOBS.get(jid) or {}).get("est_bytes")
+    need = est * STAGING_HEADROOM if est else 0
+    with STAGING_LOCK:
+        reserved = sum(r for _, r in STAGED.values())
+        if ram and STAGING_DIR and need and reserved + need <= STAGING_MAX_BYTES:
+            try:
+                os.makedirs(STAGING_DIR, exist_ok=True)
+                if shutil.disk_usage(STAGING_DIR).free >= need:
+                    d = os.path.join(STAGING_DIR, jid)
+                    os.makedirs(d, exist_ok=True)
+                    STAGED[jid] = (d, need)
+                    return d
+            except OSError:
+                pass
+        d = os.path.join(DISK_STAGING_DIR, jid)
+        os.makedirs(d, exist_ok=True)
+        STAGED[jid] = (d, 0)
+        return d
+
+def staged_in_ram(jid):
+    with STAGING_LOCK:
+        return STAGED.get(jid, (None, 0))[1] > 0
+
+def is_out_of_space(err):
+    inner = (getattr(err, "exc_info", None) or (None, None))[1] or err
+    if isinstance(inner, OSError) and inner.errno == errno.ENOSPC: return True
+    return "no space left on device" in str(err).lower()
+
+def release_staging(jid):
+    with STAGING_LOCK:
+        d, _ = STAGED.pop(jid, (None, 0))
+    if d: shutil.rmtree(d, ignore_errors=True)
+
+def publish(jid, path):
+    """Move a finished file into DOWNLOAD_DIR with one atomic rename so readers never see it half-written."""
+    dest = os.path.join(DOWNLOAD_DIR, os.path.basename(path))
+    try:
+        os.replace(path, dest)  # same filesystem (disk staging)
+    except OSError:
+        tmp = os.path.join(DOWNLOAD_DIR, f".publish-{jid}.tmp")
+        try:
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, dest)
+        except OSError:
+            try: os.remove(tmp)
+            except OSError: pass
+            raise
+    return dest
 
 # ---------- yt-dlp hooks ----------
 def ydl_progress_hook(d):
     jid = d.get("__job_id")
     if not jid: return
+    if job_cancelled(jid):
+        raise yt_dlp.utils.DownloadCancelled("Cancelled (no watchers)")
+    j = JOBS.get(jid)
+    if not j: return
     if d.get("status") == "downloading":
+        if j["stage"] != "downloading":
+            mark_phase(jid, "download")
+            set_job(jid, stage="downloading")
+        # called per chunk: publish at most PROGRESS_UPDATE_HZ times a second, without JOBS_LOCK.
+        # readers only ever see a whole Progress tuple since the swap is a single assignment.
+        now = time.monotonic()
+        if now - j["published"] < 1.0 / PROGRESS_UPDATE_HZ: return
+        j["published"] = now
         total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
         downloaded = d.get("downloaded_bytes") or 0
         prog = (downloaded/total*100.0) if total else 0.0
-        set_job(jid, stage="downloading", progress=prog, speed=d.get("speed") or 0.0, eta=d.get("eta"))
+        j["live"] = Progress(prog, d.get("speed") or 0.0, d.get("eta"))
     elif d.get("status") == "finished":
-        set_job(jid, stage="postprocessing", progress=100.0)
+        end_phase(jid)
+        set_job(jid, stage="postprocessing", live=Progress(100.0, 0.0, None))
 
 def ydl_post_hook(d):
     jid = d.get("__job_id")
     if not jid: return
+    if job_cancelled(jid):
+        raise yt_dlp.utils.DownloadCancelled("Cancelled (no watchers)")
     pp = d.get("postprocessor") or "postprocess"
     if d.get("status") == "started":
+        mark_phase(jid, pp)
         set_job(jid, stage=f"{pp}…")
     elif d.get("status") == "finished":
+        end_phase(jid)
         set_job(jid, stage=f"{pp} done")
 
+def install_popen_tracking():
+    class TrackedPopen(yt_dlp.utils.Popen):
+        """Popen that registers ffmpeg children against the job running on this thread."""
+        def __init__(self, *a, **kw):
+            super().__init__(*a, **kw)
+            jid = getattr(_CURRENT, "jid", None)
+            if jid:
+                with JOBS_LOCK:
+                    JOB_PROCS.setdefault(jid, set()).add(self)
+
+    yt_dlp.postprocessor.ffmpeg.Popen = TrackedPopen
+
+def stage_download(jid, url, opts, stage):
+    """Run yt-dlp (and the x264 pass for -x264 kinds) inside `stage`; returns (file path, MediaSummary)."""
+    opts = dict(opts)
+    opts["paths"] = {"home": stage, "temp": stage}
+    with yt_dlp.YoutubeDL(opts) as y:
+        try:
+            info = y.extract_info(url, download=True)
+        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
+            # only extractor/network errors reach the breaker; transcode, publish and disk errors are ours
+            if not job_cancelled(jid) and not is_local_failure(e):
+                breaker_record(platform_detect(url), not is_upstream_failure(e))
+            raise
+        meta = media_summary(info)
+        fpath = info.get("_filename")
+        if not fpath and "requested_downloads" in info and info["requested_downloads"]:
+            fpath = info["requested_downloads"][0].get("filepath")
+        if not fpath:
+            vid = info.get("id")
+            if vid:
+                for pth in sorted(os.listdir(stage)):
+                    if f"[{vid}]" in pth and not pth.endswith((".part", ".ytdl", ".temp")):
+                        fpath = os.path.join(stage, pth)
+        del info  # tag from the summary instead of holding the full dict
+    if not fpath or not os.path.exists(fpath):
+        raise RuntimeError("Download finished but file missing")
+    if (JOBS.get(jid, {}).get("kind") or "").endswith("-x264"):
+        fpath = segment_transcode(jid, fpath, stage, meta.duration)
+    return fpath, meta
+
 def run_download(jid, url, opts):
+    _CURRENT.jid = jid
     try:
         opts = dict(opts)
         def ph(d): d["__job_id"] = jid; ydl_progress_hook(d)
         def pph(d): d["__job_id"] = jid; ydl_post_hook(d)
         opts["progress_hooks"] = [ph]
         opts["postprocessor_hooks"] = [pph]
-        with yt_dlp.YoutubeDL(opts) as y:
-            info = y.extract_info(url, download=True)
-            fpath = info.get("_filename")
-            if not fpath and "requested_downloads" in info and info["requested_downloads"]:
-                fpath = info["requested_downloads"][0].get("filepath")
-            if not fpath:
-                vid = info.get("id")
-                if vid:
-                    k = JOBS.get(jid, {}).get("kind")
-                    t = tag_for(k) if k else None
-                    if t:
-                        p = find_existing_by_id(vid, t)
-                        if p: fpath = p
-                    if not fpath:
-                        for pth in sorted(os.listdir(DOWNLOAD_DIR)):
-                            if f"[{vid}]." in pth: fpath = os.path.join(DOWNLOAD_DIR, pth)
-            if not fpath or not os.path.exists(fpath):
-                raise RuntimeError("Download finished but file missing")
-
-            job = JOBS.get(jid, {})
-            disp = job.get("display_name")
-            if not disp:
-                title = info.get("title") or "download"
-                ext = ext_for_kind(job.get("kind"))
-                disp = sanitize(title, ext)
-
-            kind = job.get("kind") or ""
-            if kind.startswith("sc-") and fpath.lower().endswith(".mp3"):
-                sc_write_id3(fpath, info)
-
-            set_job(jid, stage="ready", progress=100.0, filepath=fpath,
-                    filename=os.path.basename(fpath), display_name=disp)
+        stage = acquire_staging(jid)
+        mark_phase(jid, "extract")
+        try:
+            fpath, meta = stage_download(jid, url, opts, stage)
+        except Exception as e:
+            # the estimate was low and tmpfs filled up: start over on disk rather than fail the job
+            if job_cancelled(jid) or not staged_in_ram(jid) or not is_out_of_space(e): raise
+            app.logger.warning(f"job {jid}: RAM staging full, retrying on disk")
+            release_staging(jid)
+            stage = acquire_staging(jid, ram=False)
+            mark_phase(jid, "extract")
+            fpath, meta = stage_download(jid, url, opts, stage)
+
+        job = JOBS.get(jid, {})
+        disp = job.get("display_name")
+        if not disp:
+            title = meta.title or "download"
+            ext = ext_for_kind(job.get("kind"))
+            disp = sanitize(title, ext)
+        disp = match_ext(disp, fpath)
+
+        kind = job.get("kind") or ""
+        if ext_for_kind(kind) == "mp3" and fpath.lower().endswith(".mp3"):
+            mark_phase(jid, "artwork")
+            art = fetch_artwork(meta.thumb)
+            mark_phase(jid, "tagging")
+            write_id3(fpath, meta, art)
+        mark_phase(jid, "publish")
+        fpath = publish(jid, fpath)
+        end_phase(jid)
+
+        set_job(jid, stage="ready", live=Progress(100.0, 0.0, None), filepath=fpath,
+                filename=os.path.basename(fpath), display_name=disp)
+        if JOBS.get(jid, {}).get("prefetch"):
+            PREFETCH_STATS["completed"] += 1
+            PREFETCH_FILES[fpath] = os.path.getsize(fpath)
     except Exception as e:
-        set_job(jid, stage="error", error=str(e))
+        if not job_cancelled(jid):
+            set_job(jid, stage="error", error=str(e))
     finally:
+        end_phase(jid)
+        release_staging(jid)
+        _CURRENT.jid = None
+        with JOBS_LOCK:
+            JOB_PROCS.pop(jid, None)
         with ACTIVE_LOCK:
             ACTIVE.discard(jid)
 
 # ---------- job queue / workers ----------
 
+def disk_free():
+    try: return shutil.disk_usage(DOWNLOAD_DIR).free
+    except OSError: return 0
+
+def job_cost(jid, now=None):
+    j = JOBS.get(jid) or {}
+    size = j.get("est_bytes") or (j.get("duration") or 0) * 250_000 or DEFAULT_JOB_BYTES
+    waited = (now or time.time()) - QUEUED[jid][2]
+    return size * 0.5 ** (waited / AGING_SECONDS)
+
+def pending_order():
+    # shortest job first, aged so big jobs still move; caller holds PENDING_LOCK
+    now = time.time()
+    return sorted(PENDING, key=lambda jid: (JOBS.get(jid, {}).get("prefetch", False), job_cost(jid, now)))
+
+def inflight_bytes():
+    total = 0
+    with ACTIVE_LOCK:
+        active = list(ACTIVE)
+    for jid in active:
+        j = JOBS.get(jid) or {}
+        total += int((j.get("est_bytes") or 0) * (1 - j["live"].progress / 100.0)) if j else 0
+    return total
+
+def pick_next():
+    # caller holds PENDING_LOCK
+    with ACTIVE_LOCK:
+        if len(ACTIVE) >= MAX_WORKERS: return None
+        busy = bool(ACTIVE)
+        idle = MAX_WORKERS - len(ACTIVE)
+    room = disk_free() - DISK_RESERVE_BYTES - inflight_bytes()
+    for jid in pending_order():
+        j = JOBS.get(jid) or {}
+        if breaker_open((j.get("kind") or "").split("-")[0]):
+            continue  # platform is failing; hold its jobs until the breaker closes
+        if j.get("prefetch") and idle <= PREFETCH_FREE_SLOTS:
+            continue  # speculative work only runs on spare capacity
+        need = j.get("est_bytes") or 0
+        if busy and need > room:
+            continue  # defer until in-flight jobs finish and free up space
+        with ACTIVE_LOCK:
+            ACTIVE.add(jid)
+        return jid
+    return None
+
 def queue_position(jid):
     with PENDING_LOCK:
         try:
-            return PENDING.index(jid) + 1
+            return pending_order().index(jid) + 1
         except ValueError:
             return 0
 
 def enqueue_job(jid, url, opts):
-    with PENDING_LOCK:
+    need = (JOBS.get(jid) or {}).get("est_bytes") or 0
+    if need and need + DISK_RESERVE_BYTES > disk_free():
+        set_job(jid, stage="error", error="Not enough disk space on server for this download")
+        return False
+    with QUEUE_COND:
         PENDING.append(jid)
-    TASKQ.put((jid, url, opts))
+        QUEUED[jid] = (url, opts, time.time())
+        QUEUE_COND.notify()
+    mark_phase(jid, "queue")
     set_job(jid, stage="queued")
+    return True
 
 def worker_loop():
+    global WORKER_THREADS
+    READY.wait()  # ffmpeg process tracking is installed during warm-up
     while True:
-        jid, url, opts = TASKQ.get()
-        while True:
+        with QUEUE_COND:
+            while True:
+                if WORKER_THREADS > MAX_WORKERS:
+                    WORKER_THREADS -= 1  # pool shrank; retire this thread between jobs
+                    return
+                jid = pick_next()
+                if jid is not None: break
+                QUEUE_COND.wait(1.0)
+            url, opts, _ = QUEUED.pop(jid)
+            PENDING.remove(jid)
+        end_phase(jid)
+        if job_cancelled(jid):
             with ACTIVE_LOCK:
-                if len(ACTIVE) < MAX_WORKERS:
-                    ACTIVE.add(jid)
-                    break
-            time.sleep(0.2)
-        with PENDING_LOCK:
-            try: PENDING.remove(jid)
-            except ValueError: pass
+                ACTIVE.discard(jid)
+            continue
         set_job(jid, stage="starting")
         run_download(jid, url, opts)
-        TASKQ.task_done()
+        with QUEUE_COND:
+            QUEUE_COND.notify_all()
+
+# ---------- worker pool sizing ----------
+WORKER_THREADS = 0
+AUTOSCALE = {"last_grow_thr": None, "last_change": "", "changed_at": 0.0, "cpu": None, "throughput": 0.0, "oldest_wait": 0.0,
+             "pinned": False}  # pinned: an admin set the target; the autoscaler leaves it alone until cleared
+_CPU_PREV = [None]
+
+def set_worker_target(n, reason=""):
+    global MAX_WORKERS, WORKER_THREADS
+    n = max(MIN_WORKERS, min(MAX_WORKERS_CAP, int(n)))
+    with QUEUE_COND:
+        if n != MAX_WORKERS:
+            AUTOSCALE["last_change"] = f"{time.strftime('%H:%M:%S')} {MAX_WORKERS}->{n} {reason}".strip()
+            AUTOSCALE["changed_at"] = time.time()
+            app.logger.info(f"worker pool {MAX_WORKERS} -> {n} {reason}")
+        MAX_WORKERS = n
+        spawn = max(0, n - WORKER_THREADS)
+        WORKER_THREADS += spawn
+        QUEUE_COND.notify_all()
+    for _ in range(spawn):
+        threading.Thread(target=worker_loop, daemon=True, name=f"worker-{secrets.token_hex(2)}").start()
+    return n
+
+def cpu_load():
+    """Busy CPU fraction since the previous call, from /proc/stat; iowait counts as idle."""
+    try:
+        with open("/proc/stat") as fh:
+            vals = [int(x) for x in fh.readline().split()[1:9]]
+    except (OSError, ValueError):
+        # no /proc (macOS); the 1-minute load average lags, which AUTOSCALE_COOLDOWN absorbs
+        try: return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError): return None  # Windows
+    idle, total = vals[3] + vals[4], sum(vals)
+    prev, _CPU_PREV[0] = _CPU_PREV[0], (idle, total)
+    if not prev or total <= prev[1]: return None
+    return 1.0 - (idle - prev[0]) / (total - prev[1])
+
+def autoscale_loop():
+    while True:
+        time.sleep(AUTOSCALE_INTERVAL)
+        try:
+            autoscale_step()
+        except Exception as e:
+            app.logger.error(f"autoscale failed: {e}")
+
+def autoscale_step():
+    now = time.time()
+    cpu = cpu_load()
+    room = disk_free() - DISK_RESERVE_BYTES - inflight_bytes()
+    with QUEUE_COND:
+        # only work another worker could start counts: not speculative, breaker-held or disk-deferred jobs
+        waits = []
+        for jid, q in QUEUED.items():
+            j = JOBS.get(jid) or {}
+            if j.get("prefetch") or breaker_open((j.get("kind") or "").split("-")[0]): continue
+            if (j.get("est_bytes") or 0) > room: continue
+            waits.append(now - q[2])
+    with ACTIVE_LOCK:
+        active = list(ACTIVE)
+    thr = sum(JOBS[j]["live"].speed or 0 for j in active if j in JOBS)
+    oldest = max(waits, default=0.0)
+    AUTOSCALE.update(cpu=cpu, throughput=thr, oldest_wait=oldest)
+    if AUTOSCALE["pinned"] or now - AUTOSCALE["changed_at"] < AUTOSCALE_COOLDOWN:
+        return
+
+    if cpu is not None and cpu > AUTOSCALE_CPU_HIGH and MAX_WORKERS > MIN_WORKERS:
+        AUTOSCALE["last_grow_thr"] = None
+        set_worker_target(MAX_WORKERS - 1, f"(cpu {cpu:.0%} busy)")
+    elif waits and oldest > AUTOSCALE_WAIT_GROW and len(active) >= MAX_WORKERS and (cpu is None or cpu < AUTOSCALE_CPU_LOW):
+        last = AUTOSCALE["last_grow_thr"]
+        if last and thr < last * 1.05:
+            return  # the previous grow bought no throughput; the pipe or disk is the bottleneck
+        AUTOSCALE["last_grow_thr"] = thr or None
+        set_worker_target(MAX_WORKERS + 1, f"(oldest queued {oldest:.0f}s)")
+
+@app.route("/server/workers", methods=["GET", "POST"])
+def admin_workers():
+    global MIN_WORKERS, MAX_WORKERS_CAP
+    if not is_local(request.remote_addr):
+        return abort(403)
+    if request.method == "POST":
+        args = request.get_json(silent=True) or request.form
+        # a numeric target pins the pool; target "auto" hands it back to the autoscaler
+        t = str(args.get("target") or "").strip().lower()
+        try:
+            lo = int(args.get("min") or MIN_WORKERS)
+            hi = int(args.get("max") or MAX_WORKERS_CAP)
+            target = int(t) if t and t != "auto" else MAX_WORKERS
+        except ValueError:
+            return jsonify({"error": "min/max must be integers; target an integer or \"auto\""}), 400
+        if lo < 1 or hi < lo:
+            return jsonify({"error": "need 1 <= min <= max"}), 400
+        MIN_WORKERS, MAX_WORKERS_CAP = lo, hi
+        if t: AUTOSCALE["pinned"] = t != "auto"
+        set_worker_target(target, "(admin)")
+        if not request.is_json:
+            return redirect("/server/")
+    return jsonify({"target": MAX_WORKERS, "min": MIN_WORKERS, "max": MAX_WORKERS_CAP,
+                    "threads": WORKER_THREADS, "active": len(ACTIVE), "queued": len(PENDING),
+                    **AUTOSCALE})
+
+# ---------- abandoned jobs ----------
+DONE_STAGES = ("ready", "error", "expired", "cancelled")
+
+def terminate_job_procs(jid):
+    with JOBS_LOCK:
+        procs = list(JOB_PROCS.get(jid, ()))
+    for p in procs:
+        try: p.terminate()
+        except Exception: pass
+
+def cancel_job(jid, reason="Cancelled (no watchers)"):
+    with JOBS_LOCK:
+        j = JOBS.get(jid)
+        if not j or j.get("stage") in DONE_STAGES: return False
+        j.update(cancelled=True, stage="cancelled", error=reason)
+        k = j.get("key")
+        if k and JOB_KEYS.get(k) == jid:
+            JOB_KEYS.pop(k, None)
+    with PENDING_LOCK:
+        queued = jid in PENDING
+        if queued:
+            PENDING.remove(jid)
+            QUEUED.pop(jid, None)
+    terminate_job_procs(jid)
+    if queued:
+        end_phase(jid)
+    return True
+
+def reap_abandoned_loop():
+    while True:
+        time.sleep(5)
+        now = time.time()
+        cutoff = now - ABANDON_GRACE_SECONDS
+        pf_cutoff = now - PREFETCH_TTL
+        with JOBS_LOCK:
+            # API jobs aren't watched by a page; they live until api_until unless someone is still polling
+            stale = [jid for jid, j in JOBS.items()
+                     if j.get("stage") not in DONE_STAGES
+                     and (j["created"] < pf_cutoff if j.get("prefetch") else j.get("last_seen", 0) < cutoff)
+                     and (j.get("api_until") or 0) < now]
+        for jid in stale:
+            j = JOBS.get(jid) or {}
+            if cancel_job(jid):
+                if j.get("prefetch"):
+                    PREFETCH_STATS["expired"] += 1
+                    PREFETCH_STATS["wasted_bytes"] += int((j.get("est_bytes") or 0) * j["live"].progress / 100.0)
+                app.logger.info(f"Cancelled abandoned job {jid}")
 
-for _ in range(max(1, MAX_WORKERS)):
-    threading.Thread(target=worker_loop, daemon=True).start()
 
 # ---------- UI ----------
 
@@ -497,10 +1499,10 @@ a.link{{color:#a7b3ff;text-decoration:none}}
 </script>
 </body></html>"""
 
-def detail_page(info, buttons, media_html=None):
-    title = info.get("title") or "Untitled"
-    creator = info.get("uploader") or info.get("channel") or info.get("artist") or "Unknown"
-    thumb = pick_thumb(info)
+def detail_page(meta, buttons, media_html=None):
+    title = meta.title or "Untitled"
+    creator = meta.creator or "Unknown"
+    thumb = meta.thumb
     btn_html = "".join([f'<a class="btn" href="{html.escape(href)}">{html.escape(lbl)}</a>' for lbl, href in buttons])
     media_block = media_html if media_html is not None else (f'<img class="thumb" src="{html.escape(thumb)}" />' if thumb else '')
     body = f"""
@@ -521,6 +1523,7 @@ def job_page(jid):
     j = JOBS.get(jid)
     if not j: abort(404)
     title = j.get("title") or "Processing…"
+    live = j["live"]
     own = "1" if (request.args.get("own") == "1") else "0"
     body = f"""
     <div class="card">
@@ -532,10 +1535,10 @@ def job_page(jid):
               <div class="small"><span id="stage">{html.escape(j.get('stage') or '')}</span></div>
               <div class="small">Queue: <span id="qpos">{"0"}</span></div>
             </div>
-            <div class="bar-wrap"><div id="bar" class="bar" style="width:{j.get('progress'):.1f}%"></div></div>
+            <div class="bar-wrap"><div id="bar" class="bar" style="width:{live.progress:.1f}%"></div></div>
             <div class="small" style="margin-top:8px">
-              <span id="pct">{j.get('progress'):.1f}%</span> •
-              <span id="speed">{human_bps(j.get('speed'))}</span>
+              <span id="pct">{live.progress:.1f}%</span> •
+              <span id="speed">{human_bps(live.speed)}</span>
               <span id="eta"></span>
             </div>
             <div id="done" style="margin-top:12px;display:none">
@@ -624,6 +1627,8 @@ def home():
         """
         return page_shell(body, "DownTil")
     if not re.match(r"^https?://", q, re.I): return redirect_home("home: bad URL in ?q")
+    c = canonicalize(q)
+    if c and canonical_path(c): return redirect(canonical_path(c))
     p = platform_detect(q)
     if p == "yt": return redirect("/yt?url=" + requests.utils.quote(q, safe=""))
     if p == "tt": return redirect("/tt?url=" + requests.utils.quote(q, safe=""))
@@ -636,46 +1641,49 @@ def yt_by_url():
     url = request.args.get("url","").strip()
     if not url or not re.match(r"^https?://", url, re.I):
         return redirect_home("yt: missing or invalid ?url")
+    c = canonicalize(url)
+    if c and canonical_path(c): return redirect(canonical_path(c))
     try:
-        with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-            info = y.extract_info(url, download=False)
+        meta = extract_summary(url)
     except Exception as e:
         return redirect_home(f"yt: extractor failed for {url!r}; {e}")
-    return yt_detail(info)
+    return yt_detail(meta)
 
 @app.route("/yt/<vid>")
 def yt_detail_by_id(vid):
+    if not valid_id(YT_ID, vid): return redirect_home(f"yt: malformed video id={vid!r}")
     try:
-        with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-            info = y.extract_info(f"https://www.youtube.com/watch?v={vid}", download=False)
+        meta = extract_summary(f"https://www.youtube.com/watch?v={vid}")
     except Exception as e:
         return redirect_home(f"yt: invalid video id={vid!r}; {e}")
-    return yt_detail(info)
+    return yt_detail(meta)
 
-def yt_detail(info):
-    vid = info.get("id")
-    mh = max_height(info)
+def yt_detail(meta):
+    vid = meta.id
+    maybe_prefetch("yt", meta, f"https://www.youtube.com/watch?v={vid}")
+    mh = meta.max_height
     buttons = []
     if mh > 1080: buttons.append((f"Highest ({mh}p)", f"/yt/{vid}/start/highest"))
     buttons.append(("HD (≤1080p)", f"/yt/{vid}/start/hd"))
-    kb = best_audio_kbps(info)
+    kb = meta.best_audio_kbps
     buttons.append((f"Audio ({kb} kbps)" if kb else "Audio (best)", f"/yt/{vid}/start/audio"))
-    s_url, s_ext, s_lang = default_sub(info)
+    if meta.native_audio: buttons.append((native_label(meta), f"/yt/{vid}/start/native"))
+    s_url, s_ext, s_lang = meta.default_sub
     if s_url: buttons.append((f"Subtitles ({s_lang.upper()})", f"/yt/{vid}/subs"))
-    if pick_thumb(info): buttons.append(("Thumbnail", f"/yt/{vid}/thumb"))
+    if meta.thumb: buttons.append(("Thumbnail", f"/yt/{vid}/thumb"))
 
     embed = f'''<iframe class="thumb"
         src="https://www.youtube.com/embed/{html.escape(vid)}?rel=0"
         title="YouTube video player" frameborder="0"
         allow="accelerometer; autoplay; clipboard-write; encrypted-media; gyroscope; picture-in-picture; web-share"
         allowfullscreen loading="lazy" referrerpolicy="origin-when-cross-origin"></iframe>'''
-    return detail_page(info, buttons, media_html=embed)
+    return detail_page(meta, buttons, media_html=embed)
 
 @app.route("/yt/<vid>/thumb")
 def yt_thumb(vid):
-    with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-        info = y.extract_info(f"https://www.youtube.com/watch?v={vid}", download=False)
-    t = pick_thumb(info)
+    if not valid_id(YT_ID, vid): abort(404)
+    meta = extract_summary(f"https://www.youtube.com/watch?v={vid}")
+    t = meta.thumb
     if not t: abort(404)
     r = requests.get(t, headers=HEADERS, stream=True, timeout=20)
     if r.status_code >= 400: abort(404)
@@ -683,28 +1691,37 @@ def yt_thumb(vid):
     ext = "jpg"
     if "png" in ct: ext="png"
     if "webp" in ct: ext="webp"
-    fname = sanitize(info.get("title") or "thumbnail", ext)
+    fname = sanitize(meta.title or "thumbnail", ext)
     return send_file(r.raw, mimetype=ct, as_attachment=True, download_name=fname)
 
 @app.route("/yt/<vid>/subs")
 def yt_subs(vid):
-    with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-        info = y.extract_info(f"https://www.youtube.com/watch?v={vid}", download=False)
-    s_url, s_ext, s_lang = default_sub(info)
+    if not valid_id(YT_ID, vid): abort(404)
+    meta = extract_summary(f"https://www.youtube.com/watch?v={vid}")
+    s_url, s_ext, s_lang = meta.default_sub
     if not s_url: abort(404, "No subtitles")
     r = requests.get(s_url, headers=HEADERS, stream=True, timeout=20)
     if r.status_code >= 400: abort(404)
-    fname = sanitize(f"{info.get('title') or 'subtitles'} [{s_lang}]", s_ext or "vtt")
+    fname = sanitize(f"{meta.title or 'subtitles'} [{s_lang}]", s_ext or "vtt")
     return send_file(r.raw, mimetype="text/vtt", as_attachment=True, download_name=fname)
 
-def _has_h264_mp4(info, max_h=None):
-    for f in (info.get("formats") or []):
-        if f.get("vcodec", "") and f["vcodec"].startswith("avc1") and (f.get("ext") == "mp4" or f.get("container") == "mp4"):
-            if max_h is None or (f.get("height") or 0) <= max_h:
-                return True
-    return False
+def native_audio_opts():
+    # remux the best AAC/Opus stream as-is: m4a stays .m4a, Opus from webm lands in .opus, no re-encode
+    return {
+        "format": "bestaudio[acodec^=mp4a]/bestaudio[acodec=opus]/bestaudio/best",
+        "postprocessors": [
+            {"key": "FFmpegExtractAudio", "preferredcodec": "best"},
+        ],
+    }
+
+def native_label(meta):
+    codec, kb = meta.native_audio
+    return f"Audio original ({codec}{f', {kb} kbps' if kb else ''})"
+
+def _has_h264_mp4(meta, max_h=None):
+    return any(max_h is None or h <= max_h for h in meta.h264_heights)
 
-def yt_opts(info, mode):
+def yt_opts(meta, mode):
     if mode == "highest":
         want_h = None
         fmt_strict = "bv*[vcodec^=avc1][ext=mp4]+ba[acodec^=mp4a]/b[vcodec^=avc1][ext=mp4]"
@@ -713,18 +1730,20 @@ def yt_opts(info, mode):
         want_h = 1080
         fmt_strict   = "bv*[height<=1080][vcodec^=avc1][ext=mp4]+ba[acodec^=mp4a]/b[height<=1080][vcodec^=avc1][ext=mp4]"
         fmt_fallback = "bv*[height<=1080]+ba/b[height<=1080]"
+    elif mode == "native":
+        return native_audio_opts()
     elif mode == "audio":
         return {
             "format": "bestaudio/best",
             "postprocessors": [
+                # tags and cover art are written by write_id3 in one pass afterwards
                 {"key": "FFmpegExtractAudio", "preferredcodec": "mp3", "preferredquality": "0"},
-                {"key": "FFmpegMetadata"},
             ],
         }
     else:
         raise ValueError("bad mode")
 
-    h264_ok = _has_h264_mp4(info, want_h)
+    h264_ok = _has_h264_mp4(meta, want_h)
 
     if h264_ok:
         return {
@@ -743,60 +1762,99 @@ def yt_opts(info, mode):
             },
         }
     else:
+        # merge only; run_download hands the mkv to segment_transcode for a parallel libx264 pass
         return {
             "format": f"{fmt_fallback}",
             "prefer_ffmpeg": True,
-            "merge_output_format": "mp4",
-            "postprocessors": [
-                {"key": "FFmpegVideoConvertor", "preferedformat": "mp4"},
-            ],
-            "postprocessor_args": {
-                "ffmpeg": [
-                    "-c:v", "libx264",
-                    "-pix_fmt", "yuv420p",
-                    "-profile:v", "high",
-                    "-level", "4.1",
-                    "-c:a", "aac", "-b:a", "192k",
-                    "-movflags", "+faststart",
-                ]
-            },
+            "merge_output_format": "mkv",
+            "postprocessor_args": {},
         }
 
+def yt_kind(meta, mode):
+    # sources without H.264 get transcoded, and cached under their own tag
+    if mode == "highest" and not _has_h264_mp4(meta): return "yt-highest-x264"
+    if mode == "hd" and not _has_h264_mp4(meta, 1080): return "yt-hd-x264"
+    return f"yt-{mode}"
+
 def job_key(kind, info_id):
     return f"{kind}:{info_id}"
 
-def reuse_or_redirect(kind, info, title, url, opts, owner=True):
-    vid = info.get("id")
-    tag = tag_for(kind)
-    disp = sanitize(info.get("title") or "download", ext_for_kind(kind))
+def claim_prefetch(j):
+    # caller holds JOBS_LOCK; a real request attached to a speculative job
+    if not j.get("prefetch"): return
+    j["prefetch"] = False
+    PREFETCH_STATS["hits"] += 1
+    if j.get("filepath"): PREFETCH_FILES.pop(j["filepath"], None)
 
+def reuse_existing(kind, vid, title, disp=None):
+    """Serve a cached file or attach to a live job for (kind, vid) without extracting. Returns (jid, state) or None."""
+    tag = tag_for(kind)
     if tag:
         existing = find_existing_by_id(vid, tag)
         if existing:
-            jid = new_job(kind, title=title, key=job_key(kind, vid), display_name=disp)
-            set_job(jid, stage="ready", progress=100.0, filepath=existing,
+            if PREFETCH_FILES.pop(existing, None) is not None:
+                PREFETCH_STATS["hits"] += 1
+            if not disp:
+                disp = sanitize(os.path.basename(existing).split(f" [{vid}]")[0], ext_for_kind(kind))
+            jid = new_job(kind, title=title, key=job_key(kind, vid), display_name=match_ext(disp, existing))
+            set_job(jid, stage="ready", live=Progress(100.0, 0.0, None), filepath=existing,
                     filename=os.path.basename(existing))
-            return redirect(f"/job/{jid}?own=1&redir=1")
+            return jid, "cached"
 
     key = job_key(kind, vid)
     with JOBS_LOCK:
         other = JOB_KEYS.get(key)
         if other and other in JOBS and not JOBS[other].get("error"):
-            return redirect(f"/job/{other}?own=0")
+            JOBS[other]["last_seen"] = time.time()
+            claim_prefetch(JOBS[other])
+            return other, "attached"
+    return None
+
+def start_job(kind, meta, title, url, opts):
+    vid = meta.id
+    tag = tag_for(kind)
+    disp = sanitize(meta.title or "download", ext_for_kind(kind))
+    hit = reuse_existing(kind, vid, title, disp)
+    if hit: return hit
 
     outtmpl = outtmpl_with_tag(tag) if tag else None
     dl_opts = ydl_opts_base(opts, outtmpl=outtmpl)
-    jid = new_job(kind, title=title, key=key, display_name=disp)
+    jid = new_job(kind, title=title, key=job_key(kind, vid), display_name=disp)
+    set_job(jid, vid=vid, est_bytes=meta.est_bytes.get(kind), duration=meta.duration)
     enqueue_job(jid, url, dl_opts)
+    return jid, "queued"
+
+def reuse_or_redirect(kind, meta, title, url, opts, owner=True):
+    jid, state = start_job(kind, meta, title, url, opts)
+    if state == "cached": return redirect(f"/job/{jid}?own=1&redir=1")
+    if state == "attached": return redirect(f"/job/{jid}?own=0")
     return redirect(f"/job/{jid}?own={'1' if owner else '0'}")
 
+def maybe_prefetch(platform, meta, url):
+    """Warm the likeliest download for short media when a detail page renders (opt-in)."""
+    kind = PREFETCH_KINDS.get(platform)
+    if not PREFETCH_ENABLED or not kind or not meta.id: return
+    if not meta.duration or meta.duration > PREFETCH_MAX_SECONDS: return
+    if (meta.est_bytes.get(kind) or PREFETCH_MAX_BYTES + 1) > PREFETCH_MAX_BYTES: return
+    tag, key = tag_for(kind), job_key(kind, meta.id)
+    if find_existing_by_id(meta.id, tag): return
+    with JOBS_LOCK:
+        other = JOB_KEYS.get(key)
+        if other and other in JOBS and not JOBS[other].get("error"): return
+    opts = yt_opts(meta, "audio") if kind == "yt-audio" else sc_mp3_opts()
+    jid = new_job(kind, title=f"{meta.title or 'Prefetch'}", key=key,
+                  display_name=sanitize(meta.title or "download", ext_for_kind(kind)))
+    set_job(jid, vid=meta.id, est_bytes=meta.est_bytes.get(kind), duration=meta.duration, prefetch=True)
+    if enqueue_job(jid, url, ydl_opts_base(opts, outtmpl=outtmpl_with_tag(tag))):
+        PREFETCH_STATS["started"] += 1
+
 @app.route("/yt/<vid>/start/<mode>")
 def yt_start(vid, mode):
+    if not valid_id(YT_ID, vid): abort(404)
     url = f"https://www.youtube.com/watch?v={vid}"
-    with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-        info = y.extract_info(url, download=False)
-    title = f"YouTube - {info.get('title') or 'Video'}"
-    return reuse_or_redirect(f"yt-{mode}", info, title, url, yt_opts(info, mode), owner=True)
+    meta = extract_summary(url)
+    title = f"YouTube - {meta.title or 'Video'}"
+    return reuse_or_redirect(yt_kind(meta, mode), meta, title, url, yt_opts(meta, mode), owner=True)
 
 # ---------- TikTok ----------
 @app.route("/tt")
@@ -804,34 +1862,35 @@ def tt_by_url():
     url = request.args.get("url","").strip()
     if not url or not re.match(r"^https?://", url, re.I):
         return redirect_home("tt: missing or invalid ?url param; redirecting home")
+    c = canonicalize(url)
+    if c and canonical_path(c): return redirect(canonical_path(c))
     try:
-        with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-            info = y.extract_info(url, download=False)
+        meta = extract_summary(url)
     except Exception as e:
         return redirect_home(f"tt: extractor failed for url={url!r}; {e}")
-    return tt_detail(info)
+    return tt_detail(meta)
 
 @app.route("/tt/<anyid>")
 def tt_by_id(anyid):
+    if not valid_id(TT_ID, anyid): return redirect_home(f"tt: malformed id={anyid!r}")
     url = f"https://www.tiktok.com/@_/video/{anyid}"
     try:
-        with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-            info = y.extract_info(url, download=False)
+        meta = extract_summary(url)
     except Exception as e:
         return redirect_home(f"tt: invalid id={anyid!r}; {e}")
-    return tt_detail(info)
+    return tt_detail(meta)
 
-def tt_detail(info):
-    vid = info.get("id")
+def tt_detail(meta):
+    vid = meta.id
     buttons = [("Download Video", f"/tt/{vid}/start/video")]
-    if pick_thumb(info): buttons.append(("Thumbnail", f"/tt/{vid}/thumb"))
-    return detail_page(info, buttons)
+    if meta.thumb: buttons.append(("Thumbnail", f"/tt/{vid}/thumb"))
+    return detail_page(meta, buttons)
 
 @app.route("/tt/<vid>/thumb")
 def tt_thumb(vid):
-    with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-        info = y.extract_info(f"https://www.tiktok.com/@_/video/{vid}", download=False)
-    t = pick_thumb(info)
+    if not valid_id(TT_ID, vid): abort(404)
+    meta = extract_summary(f"https://www.tiktok.com/@_/video/{vid}")
+    t = meta.thumb
     if not t: abort(404)
     r = requests.get(t, headers=HEADERS, stream=True, timeout=20)
     if r.status_code >= 400: abort(404)
@@ -839,29 +1898,25 @@ def tt_thumb(vid):
     ext = "jpg"
     if "png" in ct: ext="png"
     if "webp" in ct: ext="webp"
-    fname = sanitize(info.get("title") or info.get("description") or "tiktok", ext)
+    fname = sanitize(meta.title or meta.description or "tiktok", ext)
     return send_file(r.raw, mimetype=ct, as_attachment=True, download_name=fname)
 
 @app.route("/tt/<vid>/start/video")
 def tt_start_video(vid):
+    if not valid_id(TT_ID, vid): abort(404)
     url = f"https://www.tiktok.com/@_/video/{vid}"
-    with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-        info = y.extract_info(url, download=False)
-    title = f"TikTok - {info.get('title') or info.get('description') or 'Video'}"
-    return reuse_or_redirect(
-        "tt-video",
-        info,
-        title,
-        url,
-        {
-            "format": "bv*+ba/b",
-            "postprocessors": [{"key": "FFmpegVideoRemuxer", "preferedformat": "mp4"}],
-            "postprocessor_args": {
-                "ffmpeg": ["-c:v", "copy", "-c:a", "aac", "-b:a", "192k", "-movflags", "faststart"]
-            }
-        },
-        owner=True
-    )
+    meta = extract_summary(url)
+    title = f"TikTok - {meta.title or meta.description or 'Video'}"
+    return reuse_or_redirect("tt-video", meta, title, url, tt_video_opts(), owner=True)
+
+def tt_video_opts():
+    return {
+        "format": "bv*+ba/b",
+        "postprocessors": [{"key": "FFmpegVideoRemuxer", "preferedformat": "mp4"}],
+        "postprocessor_args": {
+            "ffmpeg": ["-c:v", "copy", "-c:a", "aac", "-b:a", "192k", "-movflags", "faststart"]
+        }
+    }
 
 # ---------- SoundCloud ----------
 @app.route("/sc")
@@ -869,30 +1924,35 @@ def sc_by_url():
     url = request.args.get("url","").strip()
     if not url or not re.match(r"^https?://", url, re.I):
         return redirect_home("sc: missing or invalid ?url param; redirecting home")
+    c = canonicalize(url)
+    if c and canonical_path(c): return redirect(canonical_path(c))
     try:
-        with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-            info = y.extract_info(url, download=False)
+        meta = extract_summary(url)
     except Exception as e:
         return redirect_home(f"sc: extractor failed for url={url!r}; {e}")
-    return sc_detail(info)
+    return sc_detail(meta)
 
 @app.route("/sc/<user>/<track>")
 def sc_detail_route(user, track):
     url = f"https://soundcloud.com/{user}/{track}"
-    with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-        info = y.extract_info(url, download=False)
-    return sc_detail(info)
+    try:
+        meta = extract_summary(url)
+    except Exception as e:
+        return redirect_home(f"sc: invalid track {user!r}/{track!r}; {e}")
+    return sc_detail(meta)
 
-def sc_detail(info):
-    buttons = [("Download MP3", f"/sc/{info.get('id')}/start/mp3")]
-    if pick_thumb(info): buttons.append(("Cover", f"/sc/{info.get('id')}/cover"))
-    return detail_page(info, buttons)
+def sc_detail(meta):
+    maybe_prefetch("sc", meta, f"https://api.soundcloud.com/tracks/{meta.id}")
+    buttons = [("Download MP3", f"/sc/{meta.id}/start/mp3")]
+    if meta.native_audio: buttons.append((native_label(meta), f"/sc/{meta.id}/start/native"))
+    if meta.thumb: buttons.append(("Cover", f"/sc/{meta.id}/cover"))
+    return detail_page(meta, buttons)
 
 @app.route("/sc/<sid>/cover")
 def sc_cover(sid):
-    with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-        info = y.extract_info(f"https://api.soundcloud.com/tracks/{sid}", download=False)
-    t = pick_thumb(info)
+    if not valid_id(SC_ID, sid): abort(404)
+    meta = extract_summary(f"https://api.soundcloud.com/tracks/{sid}")
+    t = meta.thumb
     if not t: abort(404)
     r = requests.get(t, headers=HEADERS, stream=True, timeout=20)
     if r.status_code >= 400: abort(404)
@@ -900,24 +1960,189 @@ def sc_cover(sid):
     ext = "jpg"
     if "png" in ct: ext="png"
     if "webp" in ct: ext="webp"
-    fname = sanitize(f"{info.get('uploader') or 'Artist'} - {info.get('title') or 'cover'}", ext)
+    fname = sanitize(f"{meta.uploader or 'Artist'} - {meta.title or 'cover'}", ext)
     return send_file(r.raw, mimetype=ct, as_attachment=True, download_name=fname)
 
 @app.route("/sc/<sid>/start/mp3")
 def sc_start_mp3(sid):
+    if not valid_id(SC_ID, sid): abort(404)
     url = f"https://api.soundcloud.com/tracks/{sid}"
-    with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
-        info = y.extract_info(url, download=False)
-    title = f"SoundCloud - {info.get('title') or 'Track'}"
-    return reuse_or_redirect("sc-mp3", info, title, url, {
+    meta = extract_summary(url)
+    title = f"SoundCloud - {meta.title or 'Track'}"
+    return reuse_or_redirect("sc-mp3", meta, title, url, sc_mp3_opts(), owner=True)
+
+@app.route("/sc/<sid>/start/native")
+def sc_start_native(sid):
+    if not valid_id(SC_ID, sid): abort(404)
+    url = f"https://api.soundcloud.com/tracks/{sid}"
+    meta = extract_summary(url)
+    title = f"SoundCloud - {meta.title or 'Track'}"
+    return reuse_or_redirect("sc-native", meta, title, url, native_audio_opts(), owner=True)
+
+def sc_mp3_opts():
+    return {
         "format": "bestaudio/best",
-        "addmetadata": True, "writethumbnail": True,
+        # tags and cover art are written by write_id3 in one pass afterwards
         "postprocessors": [
             {"key":"FFmpegExtractAudio","preferredcodec":"mp3","preferredquality":"0"},
-            {"key":"FFmpegMetadata"},
-            {"key":"EmbedThumbnail"},
         ]
-    }, owner=True)
+    }
+
+# ---------- JSON API ----------
+API_MAX_ITEMS = 50
+API_EXTRACT_PARALLEL = 4    # background extractions for submitted items
+IDEMPOTENCY_TTL = 24 * 3600
+API_JOB_TTL = int(os.environ.get("DOWNTIL_API_JOB_TTL", str(6 * 3600)))  # unpolled API jobs are dropped after this
+IDEM_LOCK = threading.Lock()
+IDEMPOTENCY = {}
+API_POOL = ThreadPoolExecutor(max_workers=API_EXTRACT_PARALLEL, thread_name_prefix="api")
+
+def canonical_url(c):
+    p, cid = c
+    if p == "yt": return f"https://www.youtube.com/watch?v={cid}"
+    if p == "tt": return f"https://www.tiktok.com/@_/video/{cid}"
+    if p == "sc": return f"https://soundcloud.com/{cid}" if "/" in cid else f"https://api.soundcloud.com/tracks/{cid}"
+    return None
+
+def kind_opts(kind, meta):
+    if kind.startswith("yt-"): return yt_opts(meta, kind[3:].replace("-x264", ""))
+    if kind == "tt-video": return tt_video_opts()
+    if kind == "sc-mp3": return sc_mp3_opts()
+    if kind == "sc-native": return native_audio_opts()
+    raise ValueError("bad kind")
+
+def kind_title(kind, meta):
+    return {
+        "yt": f"YouTube - {meta.title or 'Video'}",
+        "tt": f"TikTok - {meta.title or meta.description or 'Video'}",
+        "sc": f"SoundCloud - {meta.title or 'Track'}",
+    }[kind.split("-")[0]]
+
+def keep_api_job(jid):
+    with JOBS_LOCK:
+        if jid in JOBS: JOBS[jid]["api_until"] = time.time() + API_JOB_TTL
+
+def api_result(jid, state, **extra):
+    keep_api_job(jid)
+    return dict(status=state, job_id=jid, status_url=f"/job/{jid}/status",
+                file_url=(f"/job/{jid}/file" if state == "cached" else None), **extra)
+
+def api_resolve(jid, kind, c):
+    """Background half of a submission: extract, settle the final kind, then serve from cache or queue `jid`."""
+    url = canonical_url(c)
+    try:
+        meta = extract_summary(url)
+        if kind in ("yt-highest", "yt-hd"): kind = yt_kind(meta, kind[3:])
+        opts = kind_opts(kind, meta)
+    except Exception as e:
+        end_phase(jid)
+        set_job(jid, stage="error", error=str(e))
+        return
+    tag, key = tag_for(kind), job_key(kind, meta.id)
+    with JOBS_LOCK:
+        j = JOBS.get(jid)
+        if not j or j.get("cancelled"): return
+        # the key may change with the final kind (x264) or the real id (SoundCloud permalinks)
+        if j["key"] != key:
+            if j["key"] and JOB_KEYS.get(j["key"]) == jid: JOB_KEYS.pop(j["key"], None)
+            JOB_KEYS.setdefault(key, jid)
+        j.update(kind=kind, key=key, title=kind_title(kind, meta), vid=meta.id,
+                 display_name=sanitize(meta.title or "download", ext_for_kind(kind)),
+                 est_bytes=meta.est_bytes.get(kind), duration=meta.duration)
+    existing = find_existing_by_id(meta.id, tag) if tag else None
+    if existing:
+        end_phase(jid)
+        set_job(jid, stage="ready", live=Progress(100.0, 0.0, None), filepath=existing,
+                filename=os.path.basename(existing), display_name=match_ext(JOBS[jid]["display_name"], existing))
+        return
+    enqueue_job(jid, url, ydl_opts_base(opts, outtmpl=outtmpl_with_tag(tag) if tag else None))
+
+def idem_replay(idem):
+    """Stored response for `idem`; None to (re)run the batch, or "busy" while another request holds the key."""
+    rec = IDEMPOTENCY.get(idem)
+    if not rec: return None
+    if rec[1] is None: return "busy"
+    jids = [it["job_id"] for it in rec[1]["items"]]
+    with JOBS_LOCK:
+        # a job that failed or was dropped since is retried, not replayed; the rest dedupe on their keys
+        if any(jid not in JOBS or JOBS[jid].get("error") for jid in jids): return None
+    return rec[1]
+
+@app.route("/api/jobs", methods=["POST"])
+def api_jobs():
+    """Bulk submit: {"items": [{"url": ..., "kind": "yt-hd"}, ...]} -> one result per item, in order.
+
+    Job ids come back at once; extraction happens in the background, so a job starts in the "resolving"
+    stage and its status_url reports any extraction error. Jobs don't need polling to stay queued; they
+    are dropped API_JOB_TTL after submission (or the last idempotent retry) unless someone is still
+    polling their status_url.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "body must be a JSON object"}), 400
+    items = body.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+    if len(items) > API_MAX_ITEMS:
+        return jsonify({"error": f"at most {API_MAX_ITEMS} items per request"}), 400
+    if not all(isinstance(it, dict) for it in items):
+        return jsonify({"error": "each item must be an object"}), 400
+
+    idem = request.headers.get("Idempotency-Key") or body.get("idempotency_key")
+    now = time.time()
+    if idem:
+        with IDEM_LOCK:
+            for k, (ts, _) in list(IDEMPOTENCY.items()):
+                if now - ts >= IDEMPOTENCY_TTL: IDEMPOTENCY.pop(k, None)
+            replay = idem_replay(idem)
+            if replay == "busy":
+                return jsonify({"error": "a request with this idempotency key is in progress"}), 409
+            if replay:
+                for it in replay["items"]: keep_api_job(it["job_id"])  # a retry is a sign of life
+                return jsonify(replay)
+            IDEMPOTENCY[idem] = (now, None)  # reserve the key before doing any work
+
+    try:
+        results = [None] * len(items)
+        todo = {}  # job key -> index of the first item with it
+        for i, it in enumerate(items):
+            url = str(it.get("url") or "").strip()
+            kind = str(it.get("kind") or "")
+            c = canonicalize(url) if re.match(r"^https?://", url, re.I) else None
+            if not c:
+                results[i] = {"status": "error", "error": "unsupported or invalid url"}; continue
+            # -x264 variants are picked per source by the server, never requested
+            if not tag_for(kind) or kind.endswith("-x264") or kind.split("-")[0] != c[0]:
+                results[i] = {"status": "error", "error": f"kind {kind!r} not valid for this url"}; continue
+            key = job_key(kind, c[1])
+            if key in todo:
+                results[i] = results[todo[key]]; continue
+            todo[key] = i
+            # canonical ids equal extracted ids except SoundCloud permalinks, which only dedupe once resolved
+            hit = None
+            if "/" not in c[1]:
+                # yt-hd/yt-highest may have resolved to their -x264 variant on an earlier submission
+                for k in (kind, f"{kind}-x264") if kind in ("yt-hd", "yt-highest") else (kind,):
+                    hit = hit or reuse_existing(k, c[1], f"{c[0]} - {c[1]}")
+            if hit:
+                results[i] = api_result(*hit); continue
+            jid = new_job(kind, title=f"{c[0]} - {c[1]}", key=key if "/" not in c[1] else None)
+            set_job(jid, stage="resolving")
+            mark_phase(jid, "resolve")
+            API_POOL.submit(api_resolve, jid, kind, c)
+            results[i] = api_result(jid, "queued")
+    except Exception:
+        if idem:
+            with IDEM_LOCK: IDEMPOTENCY.pop(idem, None)
+        raise
+
+    out = {"items": [dict(r, url=items[i].get("url"), kind=items[i].get("kind")) for i, r in enumerate(results)]}
+    if idem:
+        with IDEM_LOCK:
+            # errored batches aren't remembered, so a corrected retry with the same key runs again
+            if any(r["status"] == "error" for r in results): IDEMPOTENCY.pop(idem, None)
+            else: IDEMPOTENCY[idem] = (now, out)
+    return jsonify(out)
 
 # ---------- Jobs ----------
 @app.route("/job/<jid>")
@@ -928,7 +2153,9 @@ def job_view(jid):
 def job_status(jid):
     j = JOBS.get(jid)
     if not j: return jsonify({"error":"unknown job"}), 404
-    eta_val = j.get("eta")
+    touch_job(jid)
+    live = j["live"]
+    eta_val = live.eta
     try:
         eta_val = round(float(eta_val), 2) if eta_val is not None else None
     except Exception:
@@ -936,9 +2163,9 @@ def job_status(jid):
     return jsonify({
         "id": j["id"],
         "stage": j["stage"],
-        "progress": j["progress"],
-        "speed": j["speed"],
-        "speed_human": human_bps(j["speed"]),
+        "progress": live.progress,
+        "speed": live.speed,
+        "speed_human": human_bps(live.speed),
         "eta": eta_val,
         "queue_position": queue_position(jid),
         "ready": (j.get("filepath") is not None and j.get("error") is None),
@@ -946,11 +2173,18 @@ def job_status(jid):
         "error": j.get("error"),
     })
     
+@app.route("/job/<jid>/timeline")
+def job_timeline_view(jid):
+    j = JOBS.get(jid)
+    if not j: return jsonify({"error":"unknown job"}), 404
+    return jsonify({"id": jid, "kind": j.get("kind"), "stage": j.get("stage"), "spans": job_timeline(j)})
+
 @app.route("/job/<jid>/file")
 def job_file(jid):
     j = JOBS.get(jid)
     if not j or not j.get("filepath") or not os.path.exists(j["filepath"]):
         abort(404)
+    touch_job(jid)
     disp = j.get("display_name")
     if not disp:
         title_guess = (j.get("title") or "download").split(" - ", 1)[-1]
@@ -971,6 +2205,9 @@ def clear_cache_loop():
                     removed += 1
                 except:
                     pass
+            for fp in list(PREFETCH_FILES):
+                if not os.path.exists(fp):
+                    PREFETCH_STATS["wasted_bytes"] += PREFETCH_FILES.pop(fp, 0)
 
             removed_refs = 0
             with JOBS_LOCK:
@@ -999,6 +2236,8 @@ def troll_json():
     ua = request.headers.get("User-Agent", "Unknown")
     returnFakeData = False
     print(f"[HONEYPOT HIT] IP={ip}, UA={ua}")
+    SHED_STATS["honeypot_hits"] += 1
+    block_client(ip, ua)
 
     if returnFakeData:
         return jsonify({
@@ -1020,7 +2259,52 @@ def troll_json():
     else:
         abort(403)
             
-threading.Thread(target=clear_cache_loop, daemon=True).start()
+# ---------- startup ----------
+READY = threading.Event()
+STARTED_LOCK = threading.Lock()
+STARTED = False
+
+def warm_up():
+    t0 = time.time()
+    try:
+        install_popen_tracking()
+        with yt_dlp.YoutubeDL(ydl_opts_base()) as y:
+            for ie in ("Youtube", "TikTok", "Soundcloud"):
+                y.get_info_extractor(ie)
+        import mutagen.id3  # noqa: F401
+    except Exception as e:
+        app.logger.error(f"warm-up failed: {e}")
+    READY.set()
+    app.logger.info(f"warm-up done in {time.time() - t0:.2f}s")
+
+def startup():
+    """Clear the download cache and start background threads. Safe to call more than once."""
+    global STARTED
+    with STARTED_LOCK:
+        if STARTED: return
+        STARTED = True
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    for fn in os.listdir(DOWNLOAD_DIR):
+        try: os.remove(os.path.join(DOWNLOAD_DIR, fn))
+        except: pass
+    for d in (STAGING_DIR, DISK_STAGING_DIR):
+        if d: shutil.rmtree(d, ignore_errors=True)
+    threading.Thread(target=warm_up, daemon=True, name="warm-up").start()
+    set_worker_target(MAX_WORKERS)
+    threading.Thread(target=autoscale_loop, daemon=True).start()
+    threading.Thread(target=clear_cache_loop, daemon=True).start()
+    threading.Thread(target=reap_abandoned_loop, daemon=True).start()
+    threading.Thread(target=breaker_probe_loop, daemon=True).start()
+    threading.Thread(target=version_check_loop, daemon=True).start()
+
+def create_app():
+    """App factory: `gunicorn 'main:create_app()'`. Importing main alone has no side effects."""
+    startup()
+    return app
+
+@app.route("/ready")
+def ready():
+    return jsonify({"ready": READY.is_set()}), (200 if READY.is_set() else 503)
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=80, debug=False, use_reloader=True)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=80, debug=False, use_reloader=True)
\ No newline at end of file